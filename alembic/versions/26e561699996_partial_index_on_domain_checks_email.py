@@ -0,0 +1,38 @@
+"""Replace domain_checks email index with a partial index
+
+Revision ID: 26e561699996
+Revises: 73a306d0d5a8
+Create Date: 2026-10-15 11:02:18.904176
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '26e561699996'
+down_revision: Union[str, Sequence[str], None] = '73a306d0d5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Only real addresses are ever looked up; anonymous checks are stored
+    # with a shared placeholder (or NULL in older rows) and are left out
+    op.create_index(
+        'ix_domain_checks_email_notnull',
+        'domain_checks',
+        ['email'],
+        unique=False,
+        postgresql_where=sa.text("email IS NOT NULL AND email <> 'anonymous@raposa.tech'")
+    )
+    op.drop_index(op.f('ix_domain_checks_email'), table_name='domain_checks')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_domain_checks_email'), 'domain_checks', ['email'], unique=False)
+    op.drop_index('ix_domain_checks_email_notnull', table_name='domain_checks')
@@ -0,0 +1,55 @@
+"""Add unique (domain, month_year) index to domain_usage
+
+Revision ID: 73a306d0d5a8
+Revises: 836327f86dca
+Create Date: 2026-10-15 10:12:44.512309
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '73a306d0d5a8'
+down_revision: Union[str, Sequence[str], None] = '836327f86dca'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Concurrent first checks could insert duplicate usage rows; fold them
+    # into the oldest row before enforcing uniqueness
+    op.execute("""
+        UPDATE domain_usage AS u
+        SET check_count = d.total_checks, last_check = d.last_check
+        FROM (
+            SELECT MIN(id) AS keep_id,
+                   SUM(check_count) AS total_checks,
+                   MAX(last_check) AS last_check
+            FROM domain_usage
+            GROUP BY domain, month_year
+            HAVING COUNT(*) > 1
+        ) AS d
+        WHERE u.id = d.keep_id
+    """)
+    op.execute("""
+        DELETE FROM domain_usage AS a
+        USING domain_usage AS b
+        WHERE a.domain = b.domain
+          AND a.month_year = b.month_year
+          AND a.id > b.id
+    """)
+
+    op.drop_index(op.f('ix_domain_usage_domain'), table_name='domain_usage')
+    op.drop_index(op.f('ix_domain_usage_month_year'), table_name='domain_usage')
+    op.create_index('ix_domain_usage_domain_month', 'domain_usage', ['domain', 'month_year'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_domain_usage_domain_month', table_name='domain_usage')
+    op.create_index(op.f('ix_domain_usage_month_year'), 'domain_usage', ['month_year'], unique=False)
+    op.create_index(op.f('ix_domain_usage_domain'), 'domain_usage', ['domain'], unique=False)
@@ -1,15 +1,19 @@
-from typing import Union, Optional
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from typing import Union, Optional, Dict, Tuple
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, exists, func
+from sqlalchemy.dialects.postgresql import insert
 from src.database import get_db, engine
-from src.models import Base, DomainCheck, DomainUsage
+from src.models import ANONYMOUS_EMAIL, Base, DomainCheck, DomainUsage
 from src.schemas import DomainCheckRequest, DomainCheckResponse
 from src.dns_utils import check_all_dns_records
 from src.email_service import get_email_service
 # Force redeploy to clear cached database connection state
 import re
+import time
+import asyncio
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
@@ -22,11 +26,31 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def create_db_and_tables():
-    import time
-    import os
-    max_retries = 3
-    retry_delay = 2  # Shorter delay for development
+# Compiled once at import; used by is_valid_domain on every check
+DOMAIN_PATTERN = re.compile(
+    r'^[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?)*$'
+)
+# Loopback, unspecified, RFC 1918 private and link-local (cloud metadata)
+# addresses. str.startswith() walks the tuple in C, which stays fast as it
+# grows; a trie/automaton only pays off for far larger lists.
+PRIVATE_DOMAIN_PREFIXES = (
+    'localhost', '127.', '0.0.0.0', '10.', '192.168.', '169.254.',
+) + tuple(f'172.{octet}.' for octet in range(16, 32))
+
+# Current "YYYY-MM" usage key, refreshed at most every 30 seconds
+_month_key_cache = {"ts": 0.0, "key": ""}
+
+def current_month_key() -> str:
+    """Return the month key used for usage tracking, e.g. "2025-01"."""
+    now = time.time()
+    cache = _month_key_cache
+    if now - cache["ts"] > 30:
+        cache["key"] = datetime.utcnow().strftime("%Y-%m")
+        cache["ts"] = now
+    return cache["key"]
+
+def create_db_and_tables(max_retries: int = 5):
+    import random
 
     # Check if we're in development mode
     is_development = os.getenv("ENVIRONMENT") == "development"
@@ -80,7 +104,10 @@ def create_db_and_tables():
         except Exception as e:
             logger.error(f"Database setup attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
+                # Exponential backoff with jitter so restarting workers/pods
+                # do not hit the database in lockstep
+                retry_delay = min(30, 0.5 * (2 ** attempt)) + random.uniform(0, 0.5)
+                logger.info(f"Retrying in {retry_delay:.1f} seconds...")
                 time.sleep(retry_delay)
             else:
                 logger.error("All database setup attempts failed.")
@@ -96,6 +123,12 @@ def create_db_and_tables():
 
 # Global flag to track if database is ready
 database_ready = False
+_database_init_lock = asyncio.Lock()
+
+# Report email queue: bounded so a SendGrid outage can't grow memory without limit
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "4"))
+EMAIL_DRAIN_TIMEOUT = 10.0
 
 # Environment-based docs configuration
 docs_url = "/docs" if os.getenv("ENVIRONMENT") == "development" else None
@@ -106,28 +139,76 @@ app = FastAPI(
     description="Advanced API for checking domain DNS records including MX, SPF, DKIM, and DMARC with intelligent scoring and email reporting",
     version="2.0.0",
     docs_url=docs_url,
-    redoc_url=redoc_url
+    redoc_url=redoc_url,
+    # DNS analysis responses are large; serialize them with orjson
+    default_response_class=ORJSONResponse
 )
 
-# Configure CORS for frontend development with custom origin checking
+class LiteralFirstCORSMiddleware(CORSMiddleware):
+    """CORS middleware that tries exact origins before the wildcard regex."""
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app, **kwargs)
+        # Starlette keeps allow_origins as the list passed in; hash it once
+        self._literal_origins = frozenset(self.allow_origins)
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        # A set lookup settles the common origins without running the regex,
+        # and a miss goes straight to the regex instead of rescanning the list
+        if self.allow_all_origins or origin in self._literal_origins:
+            return True
+        return self.allow_origin_regex is not None and self.allow_origin_regex.fullmatch(origin) is not None
+
+# Configure CORS for frontend development with custom origin checking.
+# Known origins are matched exactly; the regex only covers wildcard subdomains.
 app.add_middleware(
-    CORSMiddleware,
-    allow_origin_regex=r"https://.*\.raposa\.tech|https://raposa\.tech|https://.*\.vercel\.app|https?://localhost:3000|https?://127\.0\.0\.1:3000",
+    LiteralFirstCORSMiddleware,
+    allow_origins=[
+        "https://raposa.tech",
+        "http://localhost:3000",
+        "https://localhost:3000",
+        "http://127.0.0.1:3000",
+        "https://127.0.0.1:3000",
+    ],
+    allow_origin_regex=r"https://.*\.(?:raposa\.tech|vercel\.app)",
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     global database_ready
     logger.info("Starting application...")
-    # Try to initialize database, but don't fail if it's not available
-    database_ready = create_db_and_tables()
+    # Try to initialize database, but don't fail if it's not available.
+    # Runs in a thread so retries and migrations don't block the event loop.
+    database_ready = await asyncio.to_thread(create_db_and_tables)
     if not database_ready:
         logger.warning("Database not available at startup. Will retry on first request.")
+    # Report emails are sent by a fixed pool of workers fed from a bounded
+    # queue, so slow SendGrid calls never hold up request handling
+    app.state.email_queue = asyncio.Queue(maxsize=EMAIL_QUEUE_SIZE)
+    app.state.email_workers = [
+        asyncio.create_task(_email_worker(app.state.email_queue))
+        for _ in range(EMAIL_WORKERS)
+    ]
     logger.info("Application startup completed.")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Give queued reports a chance to go out before stopping the workers
+    try:
+        await asyncio.wait_for(app.state.email_queue.join(), timeout=EMAIL_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutting down with {app.state.email_queue.qsize()} report emails unsent")
+    for worker in app.state.email_workers:
+        worker.cancel()
+    await asyncio.gather(*app.state.email_workers, return_exceptions=True)
+    # Only close the email service if a request actually created it
+    if get_email_service.cache_info().currsize:
+        await get_email_service().aclose()
+    logger.info("Application shutdown completed.")
+
 @app.get("/")
 def read_root():
     return {"message": "Raposa Domain Checker API", "version": "1.0.0"}
@@ -139,40 +220,98 @@ def health_check_endpoint():
     # Database initialization happens asynchronously
     return {"status": "ok", "timestamp": datetime.utcnow().isoformat()}
 
-def ensure_database_ready():
+async def ensure_database_ready():
     """Ensure database is initialized and ready for use."""
     global database_ready
     if not database_ready:
-        logger.info("Database not ready, attempting to initialize...")
-        database_ready = create_db_and_tables()
+        # One attempt in a worker thread: the request should fail fast with a
+        # 503 rather than sit through the startup backoff, and the event loop
+        # must stay free for other requests meanwhile. Concurrent requests
+        # share the attempt instead of each starting their own.
+        async with _database_init_lock:
+            if not database_ready:
+                logger.info("Database not ready, attempting to initialize...")
+                database_ready = await asyncio.to_thread(create_db_and_tables, 1)
         if not database_ready:
             raise HTTPException(
                 status_code=503,
                 detail="Database service temporarily unavailable. Please try again later."
             )
 
-async def is_valid_domain(domain: str) -> bool:
+def is_valid_domain(domain: str) -> bool:
     """Validate domain format and safety."""
-    # Basic domain validation
-    domain_pattern = re.compile(
-        r'^[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?)*$'
-    )
-
-    if not domain_pattern.match(domain):
-        return False
-
-    # Check for private/internal domains
-    private_domains = ['localhost', '127.0.0.1', '0.0.0.0', '10.', '192.168.', '172.']
-    if any(domain.startswith(private) for private in private_domains):
-        return False
-
-    return True
+    # Basic domain validation, then reject private/internal domains
+    return bool(DOMAIN_PATTERN.match(domain)) and not domain.startswith(PRIVATE_DOMAIN_PREFIXES)
+
+# DNS analyses currently in flight, keyed by domain
+_inflight_analyses: Dict[str, asyncio.Future] = {}
+
+# Recently completed analyses, keyed by domain: (monotonic timestamp, result).
+# Kept short so a user re-checking after fixing a record sees the change.
+DNS_RESULT_TTL = float(os.getenv("DNS_RESULT_TTL", "60"))
+DNS_RESULT_CACHE_SIZE = 1024
+_recent_analyses: Dict[str, Tuple[float, dict]] = {}
+
+def _remember_analysis(domain: str, future: asyncio.Future) -> None:
+    """Move a finished analysis from the in-flight table into the TTL cache."""
+    _inflight_analyses.pop(domain, None)
+    if future.cancelled() or future.exception() is not None:
+        return
+    if len(_recent_analyses) >= DNS_RESULT_CACHE_SIZE:
+        # Dicts keep insertion order, so the first entry is the oldest
+        _recent_analyses.pop(next(iter(_recent_analyses)))
+    _recent_analyses[domain] = (time.monotonic(), future.result())
+
+async def analyze_domain(domain: str) -> dict:
+    """
+    Run the DNS analysis for a domain, sharing it with concurrent callers.
 
-async def send_domain_report_email(email: str, domain: str, analysis_results: dict, is_first_check: bool = False):
+    Simultaneous checks of the same domain (e.g. a double-submitted form)
+    await a single set of DNS lookups instead of each issuing their own,
+    and a result less than DNS_RESULT_TTL seconds old is reused outright.
+    """
+    cached = _recent_analyses.get(domain)
+    if cached is not None:
+        if time.monotonic() - cached[0] < DNS_RESULT_TTL:
+            return cached[1]
+        del _recent_analyses[domain]
+
+    future = _inflight_analyses.get(domain)
+    if future is None:
+        future = asyncio.ensure_future(check_all_dns_records(domain))
+        _inflight_analyses[domain] = future
+        future.add_done_callback(lambda done: _remember_analysis(domain, done))
+    # Shield so one cancelled caller does not cancel the lookup for the others
+    return await asyncio.shield(future)
+
+async def send_domain_report_email(
+    email: str,
+    domain: str,
+    dns_analysis: dict,
+    created_at: datetime,
+    is_first_check: bool = False
+):
     """Background task to send domain report email."""
     try:
         email_service = get_email_service()
 
+        # Reshaped here, after the response is sent, rather than on the request
+        # path; dns_analysis may be shared with concurrent checks, so it is
+        # copied rather than renamed in place
+        analysis_results = {
+            "domain": domain,
+            "score": dns_analysis["total_score"],
+            "grade": dns_analysis["grade"],
+            "mx_record": dns_analysis["mx"],
+            "spf_record": dns_analysis["spf"],
+            "dkim_record": dns_analysis["dkim"],
+            "dmarc_record": dns_analysis["dmarc"],
+            "issues": dns_analysis["issues"],
+            "recommendations": dns_analysis["recommendations"],
+            "security_summary": dns_analysis["security_summary"],
+            "created_at": created_at.isoformat()
+        }
+
         # Send comprehensive domain report
         # Note: Welcome emails are handled by the separate identity service
         success = await email_service.send_domain_report(
@@ -189,6 +328,25 @@ async def send_domain_report_email(email: str, domain: str, analysis_results: di
     except Exception as e:
         logger.error(f"Error in background email task for {email}, domain {domain}: {e}")
 
+async def _email_worker(queue: asyncio.Queue):
+    """Send queued domain report emails one at a time until cancelled."""
+    while True:
+        job = await queue.get()
+        try:
+            # send_domain_report_email logs its own failures
+            await send_domain_report_email(**job)
+        finally:
+            queue.task_done()
+
+def enqueue_domain_report_email(**job) -> bool:
+    """Queue a domain report email for the workers; returns False if dropped."""
+    try:
+        app.state.email_queue.put_nowait(job)
+        return True
+    except asyncio.QueueFull:
+        logger.warning(f"Email queue full, dropping report for {job['email']} (domain: {job['domain']})")
+        return False
+
 async def check_rate_limits(
     domain: str, 
     email: Optional[str] = None, 
@@ -198,29 +356,29 @@ async def check_rate_limits(
     Check rate limits for domain checks.
         Returns (is_allowed, limit_message)
     """
-    current_month = datetime.now().strftime("%Y-%m")
+    current_month = current_month_key()
     
     # Check domain-based limits regardless of email
-    domain_usage = db.query(DomainUsage).filter(
+    # Only the counter is needed, so skip hydrating a full DomainUsage row
+    check_count = db.query(DomainUsage.check_count).filter(
         DomainUsage.domain == domain,
         DomainUsage.month_year == current_month
-    ).first()
+    ).scalar() or 0
 
     if email:
         # Registered user - 15 checks per domain per month
-        if domain_usage and domain_usage.check_count >= 15:
+        if check_count >= 15:
             return False, "Domain check limit exceeded. Maximum 15 checks per domain per month. Create an account for more checks!"
         return True, ""
     else:
         # Anonymous user - 1 check per domain per month (domain-based, not IP)
-        if domain_usage and domain_usage.check_count >= 1:
+        if check_count >= 1:
             return False, "You've already checked this domain this month. Provide an email address for additional checks!"
         return True, ""
 
 @app.post("/check-domain", response_model=DomainCheckResponse)
 async def check_domain(
     request: DomainCheckRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -235,14 +393,14 @@ async def check_domain(
 
     try:
         # Ensure database is ready
-        ensure_database_ready()
+        await ensure_database_ready()
 
         # Validate domain format and safety
-        if not await is_valid_domain(request.domain):
+        if not is_valid_domain(request.domain):
             raise HTTPException(status_code=422, detail="Invalid or unsafe domain format")
 
         # Use default email for anonymous users to prevent email service issues
-        effective_email = request.email or "anonymous@raposa.tech"
+        effective_email = request.email or ANONYMOUS_EMAIL
         
         logger.info(f"Domain check requested for {request.domain} by {request.email or 'anonymous user'}")
 
@@ -257,7 +415,15 @@ async def check_domain(
             raise HTTPException(status_code=429, detail=limit_message)
 
         # Perform comprehensive DNS analysis
-        dns_analysis = await check_all_dns_records(request.domain)
+        dns_analysis = await analyze_domain(request.domain)
+
+        # Check whether this is the user's first domain check before recording
+        # this one (EXISTS stops at the first match instead of counting rows)
+        is_first_check = False
+        if request.email:
+            is_first_check = not db.query(
+                exists().where(DomainCheck.email == request.email)
+            ).scalar()
 
         # Create domain check record with enhanced data
         domain_check = DomainCheck(
@@ -277,53 +443,38 @@ async def check_domain(
 
         db.add(domain_check)
 
-        # Update usage tracking - simple domain-based tracking for all users
-        current_month = datetime.now().strftime("%Y-%m")
-        
-        domain_usage = db.query(DomainUsage).filter(
-            DomainUsage.domain == request.domain,
-            DomainUsage.month_year == current_month
-        ).first()
-        
-        if domain_usage:
-            domain_usage.check_count += 1
-            domain_usage.last_check = datetime.now()
-        else:
-            domain_usage = DomainUsage(
-                domain=request.domain,
-                check_count=1,
-                month_year=current_month
-            )
-            db.add(domain_usage)
-        
+        # Update usage tracking - simple domain-based tracking for all users.
+        # A single upsert on the (domain, month_year) unique index replaces the
+        # read-then-write and cannot race into duplicate rows.
+        current_month = current_month_key()
+        usage_upsert = insert(DomainUsage).values(
+            domain=request.domain,
+            check_count=1,
+            month_year=current_month
+        ).on_conflict_do_update(
+            index_elements=[DomainUsage.domain, DomainUsage.month_year],
+            set_={
+                "check_count": DomainUsage.check_count + 1,
+                "last_check": func.now()
+            }
+        )
+        db.execute(usage_upsert)
+
+        # Flush to get the generated id and created_at back from the INSERT's
+        # RETURNING clause; everything else in the response is already known,
+        # so the row is not re-read after commit
+        db.flush()
+        check_id = domain_check.id
+        created_at = domain_check.created_at
         db.commit()
-        db.refresh(domain_check)
 
-        # Schedule background email sending only if email provided
+        # Queue the report email only if email provided
         if request.email:
-            # Check if this is the user's first domain check (for welcome email)
-            user_check_count = db.query(DomainCheck).filter(
-                DomainCheck.email == request.email
-            ).count()
-            is_first_check = user_check_count == 1
-
-            background_tasks.add_task(
-                send_domain_report_email,
+            enqueue_domain_report_email(
                 email=request.email,
                 domain=request.domain,
-                analysis_results={
-                    "domain": request.domain,
-                    "score": dns_analysis["total_score"],
-                    "grade": dns_analysis["grade"],
-                    "mx_record": dns_analysis["mx"],
-                    "spf_record": dns_analysis["spf"],
-                    "dkim_record": dns_analysis["dkim"],
-                    "dmarc_record": dns_analysis["dmarc"],
-                    "issues": dns_analysis["issues"],
-                    "recommendations": dns_analysis["recommendations"],
-                    "security_summary": dns_analysis["security_summary"],
-                    "created_at": domain_check.created_at.isoformat()
-                },
+                dns_analysis=dns_analysis,
+                created_at=created_at,
                 is_first_check=is_first_check
             )
 
@@ -331,20 +482,20 @@ async def check_domain(
 
         # Return the domain check but with original email (null for anonymous users)
         response_data = {
-            "id": domain_check.id,
+            "id": check_id,
             "email": request.email,  # Return original email, not effective_email
-            "domain": domain_check.domain,
-            "mx_record": domain_check.mx_record,
-            "spf_record": domain_check.spf_record,
-            "dkim_record": domain_check.dkim_record,
-            "dmarc_record": domain_check.dmarc_record,
-            "score": domain_check.score,
-            "grade": domain_check.grade,
-            "issues": domain_check.issues,
-            "recommendations": domain_check.recommendations,
-            "security_summary": domain_check.security_summary,
-            "created_at": domain_check.created_at,
-            "opt_in_marketing": domain_check.opt_in_marketing
+            "domain": request.domain,
+            "mx_record": dns_analysis["mx"],
+            "spf_record": dns_analysis["spf"],
+            "dkim_record": dns_analysis["dkim"],
+            "dmarc_record": dns_analysis["dmarc"],
+            "score": dns_analysis["total_score"],
+            "grade": dns_analysis["grade"],
+            "issues": dns_analysis["issues"],
+            "recommendations": dns_analysis["recommendations"],
+            "security_summary": dns_analysis["security_summary"],
+            "created_at": created_at,
+            "opt_in_marketing": request.opt_in_marketing
         }
         
         return response_data
@@ -360,21 +511,21 @@ async def check_domain(
 async def get_domain_usage(domain: str, db: Session = Depends(get_db)):
     """Get current month usage for a domain"""
     # Ensure database is ready
-    ensure_database_ready()
+    await ensure_database_ready()
 
-    current_month = datetime.now().strftime("%Y-%m")
-    usage = db.query(DomainUsage).filter(
+    current_month = current_month_key()
+    check_count = db.query(DomainUsage.check_count).filter(
         DomainUsage.domain == domain,
         DomainUsage.month_year == current_month
-    ).first()
+    ).scalar()
 
-    if not usage:
+    if check_count is None:
         return {"domain": domain, "checks_used": 0, "checks_remaining": 5}
 
     return {
         "domain": domain,
-        "checks_used": usage.check_count,
-        "checks_remaining": max(0, 5 - usage.check_count)
+        "checks_used": check_count,
+        "checks_remaining": max(0, 5 - check_count)
     }
 
 @app.get("/debug/email-service")
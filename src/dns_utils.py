@@ -3,6 +3,7 @@ DNS utility functions for domain security analysis.
 Handles MX, SPF, DKIM, DMARC, and other email security record checks.
 """
 
+import os
 import dns.resolver
 import dns.exception
 import re
@@ -10,6 +11,7 @@ import logging
 from typing import Dict, List, Optional, Any, Tuple
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,21 @@ class DNSQueryError(Exception):
     """Custom exception for DNS query errors"""
     pass
 
+# Shared by all lookups; a pool per query meant spawning and joining
+# threads for every record checked (~18 per domain with DKIM selectors).
+# Sized so several checks can run at once without queueing behind each
+# other, since lookups for missing DKIM selectors can take the full timeout.
+DNS_MAX_WORKERS = int(os.getenv("DNS_MAX_WORKERS", "128"))
+DNS_EXECUTOR = ThreadPoolExecutor(max_workers=DNS_MAX_WORKERS, thread_name_prefix="dns")
+
+@lru_cache(maxsize=None)
+def get_resolver(timeout: int) -> dns.resolver.Resolver:
+    """Return a resolver for the given timeout, reading resolv.conf only once."""
+    resolver = dns.resolver.Resolver()
+    resolver.timeout = timeout
+    resolver.lifetime = timeout
+    return resolver
+
 async def query_dns_record(domain: str, record_type: str, timeout: int = 5) -> Optional[List[str]]:
     """
     Query DNS record with proper error handling and timeout.
@@ -48,17 +65,14 @@ async def query_dns_record(domain: str, record_type: str, timeout: int = 5) -> O
         List of record strings or None if not found
     """
     try:
-        resolver = dns.resolver.Resolver()
-        resolver.timeout = timeout
-        resolver.lifetime = timeout
-
-        # Run DNS query in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            result = await loop.run_in_executor(
-                executor,
-                lambda: resolver.resolve(domain, record_type)
-            )
+        resolver = get_resolver(timeout)
+
+        # Run DNS query in the shared thread pool to avoid blocking
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            DNS_EXECUTOR,
+            lambda: resolver.resolve(domain, record_type)
+        )
 
         return [str(record) for record in result]
 
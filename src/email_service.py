@@ -3,14 +3,99 @@ Email service module using SendGrid for direct email sending.
 """
 
 import os
+import asyncio
 import logging
-from typing import Dict, List, Optional
-from datetime import datetime
-import sendgrid
-from sendgrid.helpers.mail import Mail, From, To, Subject, HtmlContent, PlainTextContent
+from functools import cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+import orjson
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
+
+if TYPE_CHECKING:
+    from sendgrid.helpers.mail import Mail
 
 logger = logging.getLogger(__name__)
 
+SENDGRID_API_URL = "https://api.sendgrid.com"
+
+# SendGrid accepts at most this many personalizations per /v3/mail/send request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+
+# Format of the "Generated on" line in reports
+GENERATED_DATE_FORMAT = '%B %d, %Y at %I:%M %p UTC'
+
+# Component status icons as HTML entities, keyed by lowercase status
+_STATUS_ICONS = {
+    "valid": "&#128994;",
+    "good": "&#128994;",
+    "warning": "&#128993;",
+    "basic": "&#128993;",
+    "invalid": "&#128308;",
+    "null_mx": "&#128308;",
+    "missing": "&#9898;"
+}
+_ICON_DEFAULT = "&#9898;"
+
+# (analysis_results key, display name, max score) for each component shown in the report
+_COMPONENT_SPECS = (
+    ("mx_record", "MX Records (Mail Exchange)", 20),
+    ("spf_record", "SPF Record (Sender Policy Framework)", 25),
+    ("dkim_record", "DKIM Records (DomainKeys Identified Mail)", 25),
+    ("dmarc_record", "DMARC Record (Domain-based Message Authentication)", 30)
+)
+
+# Shared read-only default for missing component results
+_EMPTY: Dict = {}
+
+# Score banner background per letter grade
+GRADE_COLORS = {
+    "A": "#22c55e",
+    "B": "#3b82f6",
+    "C": "#f59e0b",
+    "D": "#f97316",
+    "F": "#ef4444"
+}
+
+
+def _make_component(label: str, max_score: int, record: Dict) -> Dict:
+    """Build the template entry for one DNS component."""
+    status = (record.get("status") or "unknown").lower()
+    return {
+        "name": label,
+        "status": status.title(),
+        "score": record.get("score", 0),
+        "max_score": max_score,
+        "explanation": (record.get("explanation") or _EMPTY).get("current_status", ""),
+        "icon": _STATUS_ICONS.get(status, _ICON_DEFAULT)
+    }
+
+
+@cache
+def _load_report_templates() -> Tuple[Template, Template]:
+    """
+    Build the Jinja2 environment and compile the domain report templates.
+    
+    Deferred until the email service is first created, so processes that
+    never send email do not touch the template directory at import.
+    
+    Returns:
+        Tuple[Template, Template]: The HTML and plain text report templates
+    """
+    # Templates ship with the code, so there is no need to stat them for changes.
+    # Compiled templates are cached on disk (in a per-user temp directory) so new
+    # workers skip re-parsing them; cache_size=-1 means they are never evicted.
+    template_dir = Path(__file__).parent / "templates"
+    jinja_env = Environment(
+        loader=FileSystemLoader(template_dir),
+        autoescape=select_autoescape(['html', 'xml']),
+        bytecode_cache=FileSystemBytecodeCache(),
+        auto_reload=False,
+        cache_size=-1
+    )
+    return jinja_env.get_template('domain_report.html'), jinja_env.get_template('domain_report.txt')
+
 
 class SendGridEmailService:
     """Email service using SendGrid for direct email sending."""
@@ -20,9 +105,31 @@ class SendGridEmailService:
         if not api_key:
             raise ValueError("SENDGRID_API_KEY environment variable is required")
 
-        self.sg = sendgrid.SendGridAPIClient(api_key=api_key)
+        # Post to the v3 API directly so payloads can be serialized with orjson.
+        # One pooled HTTP/2 client per process keeps the TLS session to
+        # api.sendgrid.com alive across sends.
+        self._client = httpx.AsyncClient(
+            base_url=SENDGRID_API_URL,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            timeout=10.0
+        )
+        # Bound in-flight SendGrid requests so bursts queue here instead of
+        # timing out waiting for a pooled connection
+        self._send_semaphore = asyncio.Semaphore(int(os.getenv("SENDGRID_MAX_CONCURRENCY", "32")))
         self.from_email = os.getenv("SENDGRID_FROM_EMAIL", "hello@raposa.tech")
         self.from_name = os.getenv("SENDGRID_FROM_NAME", "Raposa Domain Checker")
+
+        # Parse and compile the report templates now rather than on first send
+        self._report_html, self._report_txt = _load_report_templates()
+
+        # The sender never changes, so build it once rather than per message
+        from sendgrid.helpers.mail import From
+        self._from = From(self.from_email, self.from_name)
         
         logger.info(f"SendGrid email service initialized successfully")
 
@@ -44,16 +151,21 @@ class SendGridEmailService:
             bool: True if email was sent successfully
         """
         try:
-            logger.info(f"Preparing to send domain report email for {to_email}, domain: {domain}")
+            # Imported lazily: the SendGrid SDK is heavy and only needed when sending
+            from sendgrid.helpers.mail import Mail, To, Subject, HtmlContent, PlainTextContent
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Preparing to send domain report email for {to_email}, domain: {domain}")
             
-            # Generate email content
+            # Generate email content; rendering is CPU-bound, so keep it off the event loop
             subject = f"Domain Security Analysis Report for {domain}"
-            html_content = self._generate_domain_report_html(domain, analysis_results)
-            text_content = self._generate_domain_report_text(domain, analysis_results)
+            html_content, text_content = await asyncio.to_thread(
+                self._render_domain_report, domain, analysis_results
+            )
             
             # Create the email
             message = Mail(
-                from_email=From(self.from_email, self.from_name),
+                from_email=self._from,
                 to_emails=To(to_email),
                 subject=Subject(subject),
                 html_content=HtmlContent(html_content),
@@ -61,192 +173,143 @@ class SendGridEmailService:
             )
             
             # Send the email
-            response = self.sg.send(message)
+            response = await self._post_mail(message)
             
             if response.status_code in [200, 201, 202]:
                 logger.info(f"✅ Domain report email sent successfully to {to_email} (domain: {domain})")
                 return True
             else:
-                logger.error(f"❌ Failed to send email. Status: {response.status_code}, Body: {response.body}")
+                logger.error(f"❌ Failed to send email. Status: {response.status_code}, Body: {response.text}")
                 return False
                 
         except Exception as e:
             logger.error(f"Failed to send domain report email: {e}")
             return False
 
-    def _generate_domain_report_html(self, domain: str, analysis_results: Dict) -> str:
-        """Generate HTML email content for domain report."""
-        score = analysis_results.get("score", 0)
-        grade = analysis_results.get("grade", "F")
-        security_level = analysis_results.get("security_summary", {}).get("security_level", "Poor")
-        mx_record = analysis_results.get("mx_record", {})
-        spf_record = analysis_results.get("spf_record", {})
-        dkim_record = analysis_results.get("dkim_record", {})
-        dmarc_record = analysis_results.get("dmarc_record", {})
-        issues = analysis_results.get("issues", [])
-        recommendations = analysis_results.get("recommendations", [])
-        
-        # Helper functions for template
-        def get_status_icon(status):
-            return "✅" if status in ["valid", "good"] else "⚠️" if status == "warning" else "❌"
-        
-        def get_status_class(status):
-            if status in ['valid', 'good']:
-                return 'valid'
-            elif status == 'warning':
-                return 'warning'
-            else:
-                return 'invalid'
-        
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>Domain Security Report</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: #2563eb; color: white; padding: 20px; text-align: center; }}
-                .score-box {{ background: #f8fafc; border: 2px solid #e2e8f0; padding: 20px; margin: 20px 0; text-align: center; }}
-                .grade {{ font-size: 48px; font-weight: bold; color: #2563eb; }}
-                .record-section {{ margin: 20px 0; padding: 15px; border-left: 4px solid #e2e8f0; }}
-                .valid {{ border-color: #10b981; }}
-                .warning {{ border-color: #f59e0b; }}
-                .invalid {{ border-color: #ef4444; }}
-                .issues {{ background: #fef2f2; padding: 15px; border-radius: 8px; }}
-                .recommendations {{ background: #f0f9ff; padding: 15px; border-radius: 8px; }}
-                .footer {{ text-align: center; padding: 20px; color: #6b7280; font-size: 14px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🛡️ Domain Security Analysis</h1>
-                    <h2>{domain}</h2>
-                </div>
-                
-                <div class="score-box">
-                    <div class="grade">{grade}</div>
-                    <div><strong>{score}/100</strong> - {security_level} Security</div>
-                </div>
-                
-                <div class="record-section {get_status_class(mx_record.get('status', 'missing'))}">
-                    <h3>{get_status_icon(mx_record.get('status', 'missing'))} MX Records</h3>
-                    <p><strong>Status:</strong> {mx_record.get('status', 'Missing').title()}</p>
-                    <p><strong>Score:</strong> {mx_record.get('score', 0)}/20</p>
-                    <p>{mx_record.get('explanation', {}).get('current_status', '')}</p>
-                </div>
-                
-                <div class="record-section {get_status_class(spf_record.get('status', 'missing'))}">
-                    <h3>{get_status_icon(spf_record.get('status', 'missing'))} SPF Record</h3>
-                    <p><strong>Status:</strong> {spf_record.get('status', 'Missing').title()}</p>
-                    <p><strong>Score:</strong> {spf_record.get('score', 0)}/25</p>
-                    <p>{spf_record.get('explanation', {}).get('current_status', '')}</p>
-                </div>
-                
-                <div class="record-section {get_status_class(dkim_record.get('status', 'missing'))}">
-                    <h3>{get_status_icon(dkim_record.get('status', 'missing'))} DKIM Record</h3>
-                    <p><strong>Status:</strong> {dkim_record.get('status', 'Missing').title()}</p>
-                    <p><strong>Score:</strong> {dkim_record.get('score', 0)}/25</p>
-                    <p>{dkim_record.get('explanation', {}).get('current_status', '')}</p>
-                </div>
-                
-                <div class="record-section {get_status_class(dmarc_record.get('status', 'missing'))}">
-                    <h3>{get_status_icon(dmarc_record.get('status', 'missing'))} DMARC Record</h3>
-                    <p><strong>Status:</strong> {dmarc_record.get('status', 'Missing').title()}</p>
-                    <p><strong>Score:</strong> {dmarc_record.get('score', 0)}/30</p>
-                    <p>{dmarc_record.get('explanation', {}).get('current_status', '')}</p>
-                </div>"""
-        
-        if issues:
-            html += """
-                <div class="issues">
-                    <h3>🔍 Issues Found</h3>
-                    <ul>"""
-            for issue in issues:
-                html += f"<li>{issue}</li>"
-            html += "</ul></div>"
-        
-        if recommendations:
-            html += """
-                <div class="recommendations">
-                    <h3>💡 Recommendations</h3>
-                    <ul>"""
-            for rec in recommendations:
-                html += f"<li>{rec}</li>"
-            html += "</ul></div>"
-        
-        html += f"""
-                <div class="footer">
-                    <p>This report was generated by <strong>Raposa Domain Checker</strong></p>
-                    <p>Visit <a href="https://domainchecker.raposa.tech">domainchecker.raposa.tech</a> for more security analyses</p>
-                    <p>Report generated on {datetime.utcnow().strftime('%B %d, %Y')}</p>
-                </div>
-            </div>
-        </body>
-        </html>"""
+    async def send_domain_reports_bulk(
+        self,
+        items: List[Tuple[str, str, Dict]],
+        concurrency: int = 4
+    ) -> int:
+        """
+        Send domain reports to many recipients with as few API calls as possible.
         
-        return html
-
-    def _generate_domain_report_text(self, domain: str, analysis_results: Dict) -> str:
-        """Generate plain text email content for domain report."""
-        score = analysis_results.get("score", 0)
-        grade = analysis_results.get("grade", "F")
-        security_level = analysis_results.get("security_summary", {}).get("security_level", "Poor")
-        mx_record = analysis_results.get("mx_record", {})
-        spf_record = analysis_results.get("spf_record", {})
-        dkim_record = analysis_results.get("dkim_record", {})
-        dmarc_record = analysis_results.get("dmarc_record", {})
-        issues = analysis_results.get("issues", [])
-        recommendations = analysis_results.get("recommendations", [])
+        Recipients whose reports render identically share a single request,
+        with one personalization each so they never see one another.
         
-        text = f"""
-DOMAIN SECURITY ANALYSIS REPORT
-{'=' * 40}
+        Args:
+            items: (to_email, domain, analysis_results) tuples
+            concurrency: Maximum number of SendGrid requests in flight
+            
+        Returns:
+            int: Number of recipients whose report was accepted by SendGrid
+        """
+        from sendgrid.helpers.mail import (
+            Mail, To, Subject, HtmlContent, PlainTextContent, Personalization
+        )
 
-Domain: {domain}
-Overall Score: {score}/100 (Grade {grade})
-Security Level: {security_level}
+        # Group recipients by report content so each report is rendered once
+        groups: Dict[Tuple[str, bytes], Tuple[Dict, List[str]]] = {}
+        for to_email, domain, analysis_results in items:
+            key = (domain, orjson.dumps(analysis_results, option=orjson.OPT_SORT_KEYS))
+            groups.setdefault(key, (analysis_results, []))[1].append(to_email)
 
-DNS RECORDS ANALYSIS
-{'=' * 20}
+        semaphore = asyncio.Semaphore(concurrency)
 
-MX Records: {mx_record.get('status', 'Missing').upper()}
-Score: {mx_record.get('score', 0)}/20
-{mx_record.get('explanation', {}).get('current_status', '')}
+        async def send_chunk(domain: str, html_content: str, text_content: str, recipients: List[str]) -> int:
+            message = Mail(
+                from_email=self._from,
+                subject=Subject(f"Domain Security Analysis Report for {domain}"),
+                html_content=HtmlContent(html_content),
+                plain_text_content=PlainTextContent(text_content)
+            )
+            for to_email in recipients:
+                personalization = Personalization()
+                personalization.add_to(To(to_email))
+                message.add_personalization(personalization)
 
-SPF Record: {spf_record.get('status', 'Missing').upper()}
-Score: {spf_record.get('score', 0)}/25
-{spf_record.get('explanation', {}).get('current_status', '')}
+            try:
+                async with semaphore:
+                    response = await self._post_mail(message)
+            except Exception as e:
+                logger.error(f"Failed to send bulk domain report for {domain}: {e}")
+                return 0
 
-DKIM Record: {dkim_record.get('status', 'Missing').upper()}
-Score: {dkim_record.get('score', 0)}/25
-{dkim_record.get('explanation', {}).get('current_status', '')}
+            if response.status_code in [200, 201, 202]:
+                return len(recipients)
+            logger.error(f"❌ Failed to send bulk domain report for {domain}. Status: {response.status_code}, Body: {response.text}")
+            return 0
 
-DMARC Record: {dmarc_record.get('status', 'Missing').upper()}
-Score: {dmarc_record.get('score', 0)}/30
-{dmarc_record.get('explanation', {}).get('current_status', '')}
-"""
-        
-        if issues:
-            text += f"\nISSUES FOUND:\n"
-            for i, issue in enumerate(issues, 1):
-                text += f"{i}. {issue}\n"
-        
-        if recommendations:
-            text += f"\nRECOMMENDATIONS:\n"
-            for i, rec in enumerate(recommendations, 1):
-                text += f"{i}. {rec}\n"
-        
-        text += f"""
-{'=' * 40}
-This report was generated by Raposa Domain Checker
-Visit: https://domainchecker.raposa.tech
-Report generated on: {datetime.utcnow().strftime('%B %d, %Y')}
-"""
+        # Every report in the batch shares one generation timestamp
+        generated_date = datetime.now(timezone.utc).strftime(GENERATED_DATE_FORMAT)
+
+        chunks = []
+        for (domain, _), (analysis_results, recipients) in groups.items():
+            html_content, text_content = await asyncio.to_thread(
+                self._render_domain_report, domain, analysis_results, generated_date
+            )
+            for start in range(0, len(recipients), SENDGRID_MAX_PERSONALIZATIONS):
+                chunk = recipients[start:start + SENDGRID_MAX_PERSONALIZATIONS]
+                chunks.append(send_chunk(domain, html_content, text_content, chunk))
+
+        sent = sum(await asyncio.gather(*chunks))
+        logger.info(f"Bulk domain reports sent to {sent}/{len(items)} recipients in {len(chunks)} requests")
+        return sent
+
+    async def _post_mail(self, message: "Mail") -> httpx.Response:
+        """POST a Mail payload to SendGrid's /v3/mail/send endpoint."""
+        content = orjson.dumps(message.get())
+        async with self._send_semaphore:
+            return await self._client.post("/v3/mail/send", content=content)
+
+    def _render_domain_report(
+        self,
+        domain: str,
+        analysis_results: Dict,
+        generated_date: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Render the HTML and plain text bodies of a domain report."""
+        template_data = self._prepare_template_data(domain, analysis_results, generated_date)
+        return self._report_html.render(**template_data), self._report_txt.render(**template_data)
+
+    def _prepare_template_data(
+        self,
+        domain: str,
+        analysis_results: Dict,
+        generated_date: Optional[str] = None
+    ) -> Dict:
+        """
+        Prepare the context shared by the HTML and text report templates.
         
-        return text
+        Args:
+            domain: Domain name being analyzed
+            analysis_results: Domain analysis data
+            generated_date: Preformatted report date; defaults to now. Bulk
+                sends pass one value for the whole batch.
+        """
+        if generated_date is None:
+            generated_date = datetime.now(timezone.utc).strftime(GENERATED_DATE_FORMAT)
+        grade = analysis_results.get("grade") or "F"
+        security_components = [
+            _make_component(label, max_score, analysis_results.get(key) or _EMPTY)
+            for key, label, max_score in _COMPONENT_SPECS
+        ]
+
+        return {
+            "domain": domain,
+            "score": analysis_results.get("score", 0),
+            "grade": grade,
+            "grade_color": GRADE_COLORS.get(grade[:1], GRADE_COLORS["F"]),
+            "security_level": (analysis_results.get("security_summary") or _EMPTY).get("security_level", "Poor"),
+            "security_components": security_components,
+            "issues": analysis_results.get("issues") or [],
+            "recommendations": analysis_results.get("recommendations") or [],
+            "generated_date": generated_date
+        }
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections to SendGrid."""
+        await self._client.aclose()
 
     def check_sendgrid_connection(self) -> bool:
         """
@@ -284,10 +347,7 @@ Report generated on: {datetime.utcnow().strftime('%B %d, %Y')}
             }
 
 
-# Global email service instance
-_email_service = None
-
-
+@cache
 def get_email_service() -> SendGridEmailService:
     """
     Get or create the global email service instance.
@@ -295,7 +355,4 @@ def get_email_service() -> SendGridEmailService:
     Returns:
         SendGridEmailService: The email service instance
     """
-    global _email_service
-    if _email_service is None:
-        _email_service = SendGridEmailService()
-    return _email_service
+    return SendGridEmailService()
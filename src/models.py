@@ -1,13 +1,26 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, Text
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, Text, Index
+from sqlalchemy.sql import func, text
 from src.database import Base
 
+# Stored in place of an email address for checks made without one
+ANONYMOUS_EMAIL = "anonymous@raposa.tech"
+
 class DomainCheck(Base):
     __tablename__ = "domain_checks"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Only real addresses are looked up, so anonymous rows stay out of the index
+        Index(
+            'ix_domain_checks_email_notnull',
+            'email',
+            postgresql_where=text(f"email IS NOT NULL AND email <> '{ANONYMOUS_EMAIL}'")
+        ),
+        {'extend_existing': True}
+    )
+    # Fetch server-generated defaults (created_at) via RETURNING on insert
+    __mapper_args__ = {'eager_defaults': True}
 
     id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, nullable=True, index=True)  # Now optional
+    email = Column(String, nullable=True)  # Now optional
     domain = Column(String, nullable=False, index=True)
 
     # Enhanced DNS record storage
@@ -30,10 +43,14 @@ class DomainCheck(Base):
 
 class DomainUsage(Base):
     __tablename__ = "domain_usage"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # One row per domain per month; serves the monthly quota lookup
+        Index('ix_domain_usage_domain_month', 'domain', 'month_year', unique=True),
+        {'extend_existing': True}
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    domain = Column(String, nullable=False, index=True)
+    domain = Column(String, nullable=False)
     check_count = Column(Integer, default=1)
     last_check = Column(DateTime(timezone=True), server_default=func.now())
-    month_year = Column(String, nullable=False, index=True)  # Format: "2025-01"
+    month_year = Column(String, nullable=False)  # Format: "2025-01"
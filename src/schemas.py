@@ -7,11 +7,18 @@ class DomainCheckRequest(BaseModel):
     domain: str = Field(..., min_length=1, max_length=255)
     opt_in_marketing: bool = False
 
+class RecordExplanation(BaseModel):
+    """Plain-English explanation attached to each DNS record result"""
+    what_is: str = ""
+    current_status: str = ""
+    risk_if_misconfigured: str = ""
+
 class DNSRecordResult(BaseModel):
     """Base model for DNS record results"""
     status: str
     issues: List[str] = []
     score: int
+    explanation: Optional[RecordExplanation] = None
 
 class MXRecordResult(DNSRecordResult):
     """MX record analysis result"""
@@ -37,10 +44,10 @@ class DomainCheckResponse(BaseModel):
     domain: str
 
     # Enhanced DNS results with user-friendly explanations
-    mx_record: Optional[Dict[str, Any]] = None
-    spf_record: Optional[Dict[str, Any]] = None
-    dkim_record: Optional[Dict[str, Any]] = None
-    dmarc_record: Optional[Dict[str, Any]] = None
+    mx_record: Optional[MXRecordResult] = None
+    spf_record: Optional[SPFRecordResult] = None
+    dkim_record: Optional[DKIMRecordResult] = None
+    dmarc_record: Optional[DMARCRecordResult] = None
 
     # Overall assessment
     score: Optional[int] = None
@@ -53,11 +60,9 @@ class DomainCheckResponse(BaseModel):
 
     # Timestamps
     created_at: datetime
-    opt_in_marketing: bool = False
 
     # Metadata
-    opt_in_marketing: bool
-    created_at: datetime
+    opt_in_marketing: bool = False
 
     class Config:
         from_attributes = True
@@ -16,6 +16,40 @@ from email_service import get_email_service
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def sample_analysis_results(test_domain):
+    """Sample analysis results for the commented-out report send in test_email_service."""
+    return {
+        "domain": test_domain,
+        "score": 85,
+        "grade": "A",
+        "mx_record": {
+            "status": "valid",
+            "score": 20,
+            "records": [{"preference": 1, "exchange": "aspmx.l.google.com"}]
+        },
+        "spf_record": {
+            "status": "valid",
+            "score": 25,
+            "record": "v=spf1 include:_spf.google.com ~all"
+        },
+        "dkim_record": {
+            "status": "valid",
+            "score": 15,
+            "selectors": {"google": {"status": "valid"}}
+        },
+        "dmarc_record": {
+            "status": "valid",
+            "score": 25,
+            "record": "v=DMARC1; p=quarantine; rua=mailto:dmarc@github.com"
+        },
+        "issues": ["Minor SPF configuration could be improved"],
+        "recommendations": [
+            "Consider implementing DKIM for better email authentication",
+            "Review DMARC policy for optimal security"
+        ],
+        "created_at": "2025-07-15T12:00:00Z"
+    }
+
 async def test_email_service():
     """Test email service initialization and basic functionality."""
 
@@ -30,38 +64,6 @@ async def test_email_service():
         test_domain = "github.com"
         test_email = "test@example.com"
 
-        test_analysis_results = {
-            "domain": test_domain,
-            "score": 85,
-            "grade": "A",
-            "mx_record": {
-                "status": "valid",
-                "score": 20,
-                "records": [{"preference": 1, "exchange": "aspmx.l.google.com"}]
-            },
-            "spf_record": {
-                "status": "valid",
-                "score": 25,
-                "record": "v=spf1 include:_spf.google.com ~all"
-            },
-            "dkim_record": {
-                "status": "valid",
-                "score": 15,
-                "selectors": {"google": {"status": "valid"}}
-            },
-            "dmarc_record": {
-                "status": "valid",
-                "score": 25,
-                "record": "v=DMARC1; p=quarantine; rua=mailto:dmarc@github.com"
-            },
-            "issues": ["Minor SPF configuration could be improved"],
-            "recommendations": [
-                "Consider implementing DKIM for better email authentication",
-                "Review DMARC policy for optimal security"
-            ],
-            "created_at": "2025-07-15T12:00:00Z"
-        }
-
         # Uncomment the following lines to test actual email sending
         # NOTE: This will send real emails if Brevo credentials are configured
 
@@ -73,7 +75,7 @@ async def test_email_service():
         # report_result = await email_service.send_domain_report(
         #     to_email=test_email,
         #     domain=test_domain,
-        #     analysis_results=test_analysis_results,
+        #     analysis_results=sample_analysis_results(test_domain),
         #     include_pdf=False  # Skip PDF for testing
         # )
         # logger.info(f"Domain report email result: {report_result}")
@@ -88,9 +90,25 @@ async def test_email_service():
 
     return True
 
+async def main(n=1):
+    """Run the email service test n times concurrently; True only if every run passed."""
+    results = await asyncio.gather(*(test_email_service() for _ in range(n)))
+    return all(results)
+
 if __name__ == "__main__":
-    # Run the test
-    success = asyncio.run(test_email_service())
+    # Use uvloop's faster event loop when it is installed
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
+    # Run the test; N repeats it on a single event loop
+    loop = asyncio.new_event_loop()
+    try:
+        success = loop.run_until_complete(main(int(os.getenv("N", "1"))))
+    finally:
+        loop.close()
 
     if success:
         print("\n🎉 Email service is ready for Phase 2.1!")